@@ -1,6 +1,6 @@
 from autogen_agentchat.agents import AssistantAgent
 
-SYSTEM_PROMPT = """You are the Action & Dependency Extraction Agent in a multi-agent document intelligence system.
+INSTRUCTIONS = """You are the Action & Dependency Extraction Agent in a multi-agent document intelligence system.
 
 OBJECTIVE:
 Extract all actionable tasks explicitly or implicitly stated in the document.
@@ -11,9 +11,9 @@ INSTRUCTIONS:
 - Infer owners/dependencies ONLY if strongly implied
 - Use null if owner or deadline is missing
 - Normalize task descriptions
-- Do NOT summarize the document
+- Do NOT summarize the document"""
 
-OUTPUT FORMAT (JSON ONLY):
+OUTPUT_FORMAT = """OUTPUT FORMAT (JSON ONLY):
 {
   "actions": [
     {
@@ -23,15 +23,42 @@ OUTPUT FORMAT (JSON ONLY):
       "deadline": "string | null"
     }
   ]
-}
+}"""
 
-Return ONLY valid JSON. No markdown, no explanation, no commentary."""
+PACKED_OUTPUT_FORMAT = """The input contains several independent documents, each between
+BEGIN/END DOCUMENT markers and identified by its document_id. Analyse every
+document separately and never mix content between documents.
 
+OUTPUT FORMAT (JSON ONLY), exactly one entry per document_id:
+{
+  "documents": [
+    {
+      "document_id": "string",
+      "actions": [
+        {
+          "task": "string",
+          "owner": "string | null",
+          "dependency": "string | null",
+          "deadline": "string | null"
+        }
+      ]
+    }
+  ]
+}"""
+
+CLOSING = "Return ONLY valid JSON. No markdown, no explanation, no commentary."
+
+SYSTEM_PROMPT = "\n\n".join([INSTRUCTIONS, OUTPUT_FORMAT, CLOSING])
+PACKED_SYSTEM_PROMPT = "\n\n".join([INSTRUCTIONS, PACKED_OUTPUT_FORMAT, CLOSING])
+
+
+def create_agent(model_client, packed: bool = False) -> AssistantAgent:
+    """Create and return the Action & Dependency Extraction Agent.
 
-def create_agent(model_client) -> AssistantAgent:
-    """Create and return the Action & Dependency Extraction Agent."""
+    With packed=True the agent answers for several delimited documents at once.
+    """
     return AssistantAgent(
         name="Action_Agent",
-        system_message=SYSTEM_PROMPT,
+        system_message=PACKED_SYSTEM_PROMPT if packed else SYSTEM_PROMPT,
         model_client=model_client,
     )
@@ -1,6 +1,6 @@
 from autogen_agentchat.agents import AssistantAgent
 
-SYSTEM_PROMPT = """You are the Risk & Open-Issues Agent in a multi-agent document intelligence system.
+INSTRUCTIONS = """You are the Risk & Open-Issues Agent in a multi-agent document intelligence system.
 
 OBJECTIVE:
 Identify unresolved questions, assumptions, ambiguities, and potential risks implied by the document.
@@ -10,22 +10,44 @@ INSTRUCTIONS:
 - Identify assumptions treated as facts
 - Capture compliance, timeline, dependency, or resource risks
 - Do NOT repeat action items
-- Do NOT summarize
+- Do NOT summarize"""
 
-OUTPUT FORMAT (JSON ONLY):
+OUTPUT_FORMAT = """OUTPUT FORMAT (JSON ONLY):
 {
   "risks": [
     "string"
   ]
-}
+}"""
 
-Return ONLY valid JSON. No markdown, no explanation, no commentary."""
+PACKED_OUTPUT_FORMAT = """The input contains several independent documents, each between
+BEGIN/END DOCUMENT markers and identified by its document_id. Analyse every
+document separately and never mix content between documents.
 
+OUTPUT FORMAT (JSON ONLY), exactly one entry per document_id:
+{
+  "documents": [
+    {
+      "document_id": "string",
+      "risks": [
+        "string"
+      ]
+    }
+  ]
+}"""
+
+CLOSING = "Return ONLY valid JSON. No markdown, no explanation, no commentary."
+
+SYSTEM_PROMPT = "\n\n".join([INSTRUCTIONS, OUTPUT_FORMAT, CLOSING])
+PACKED_SYSTEM_PROMPT = "\n\n".join([INSTRUCTIONS, PACKED_OUTPUT_FORMAT, CLOSING])
+
+
+def create_agent(model_client, packed: bool = False) -> AssistantAgent:
+    """Create and return the Risk & Open-Issues Agent.
 
-def create_agent(model_client) -> AssistantAgent:
-    """Create and return the Risk & Open-Issues Agent."""
+    With packed=True the agent answers for several delimited documents at once.
+    """
     return AssistantAgent(
         name="Risk_Agent",
-        system_message=SYSTEM_PROMPT,
+        system_message=PACKED_SYSTEM_PROMPT if packed else SYSTEM_PROMPT,
         model_client=model_client,
     )
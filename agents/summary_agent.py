@@ -1,6 +1,6 @@
 from autogen_agentchat.agents import AssistantAgent
 
-SYSTEM_PROMPT = """You are the Context-Aware Summary Agent in a multi-agent document intelligence system.
+INSTRUCTIONS = """You are the Context-Aware Summary Agent in a multi-agent document intelligence system.
 
 OBJECTIVE:
 Generate a concise, high-fidelity summary of the document that preserves:
@@ -15,20 +15,40 @@ INSTRUCTIONS:
 - Do NOT speculate
 - Merge information across all chunks
 - Preserve factual tone
-- Avoid redundancy
+- Avoid redundancy"""
 
-OUTPUT FORMAT (JSON ONLY):
+OUTPUT_FORMAT = """OUTPUT FORMAT (JSON ONLY):
 {
   "summary": "string"
-}
+}"""
 
-Return ONLY valid JSON. No markdown, no explanation, no commentary."""
+PACKED_OUTPUT_FORMAT = """The input contains several independent documents, each between
+BEGIN/END DOCUMENT markers and identified by its document_id. Analyse every
+document separately and never mix content between documents.
 
+OUTPUT FORMAT (JSON ONLY), exactly one entry per document_id:
+{
+  "documents": [
+    {
+      "document_id": "string",
+      "summary": "string"
+    }
+  ]
+}"""
+
+CLOSING = "Return ONLY valid JSON. No markdown, no explanation, no commentary."
+
+SYSTEM_PROMPT = "\n\n".join([INSTRUCTIONS, OUTPUT_FORMAT, CLOSING])
+PACKED_SYSTEM_PROMPT = "\n\n".join([INSTRUCTIONS, PACKED_OUTPUT_FORMAT, CLOSING])
+
+
+def create_agent(model_client, packed: bool = False) -> AssistantAgent:
+    """Create and return the Summary Agent.
 
-def create_agent(model_client) -> AssistantAgent:
-    """Create and return the Summary Agent."""
+    With packed=True the agent answers for several delimited documents at once.
+    """
     return AssistantAgent(
         name="Summary_Agent",
-        system_message=SYSTEM_PROMPT,
+        system_message=PACKED_SYSTEM_PROMPT if packed else SYSTEM_PROMPT,
         model_client=model_client,
     )
@@ -1,22 +1,21 @@
 import asyncio
 import json
-import os
 import time
 import html as html_lib
 
 import streamlit as st
 from dotenv import load_dotenv
-from autogen_ext.models.openai import OpenAIChatCompletionClient
-from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_agentchat.conditions import MaxMessageTermination
 
-from agents.summary_agent import create_agent as create_summary_agent
-from agents.action_agent import create_agent as create_action_agent
-from agents.risk_agent import create_agent as create_risk_agent
-from pdf_parser import pdf_to_chunks
+from orchestrator import analysis_key, content_key, run_agents, run_agents_pipelined, run_coalesced
+from pdf_parser import pdf_to_chunks, stream_pdf_chunks
 
 load_dotenv()
 
+# Pipelined ingestion settings; also part of the coalescing key
+PIPELINE_CHUNK_CHARS = 2000
+PIPELINE_WINDOW_CHARS = 16000
+PIPELINE_WINDOWS_IN_FLIGHT = 2
+
 # ── Page Config ──
 st.set_page_config(page_title="Document Intelligence", page_icon="🔍", layout="wide")
 
@@ -279,54 +278,6 @@ html, body, .stApp, [class*="css"] {
 
 # ── Core Functions ──
 
-def get_model_client():
-    return OpenAIChatCompletionClient(
-        model=os.getenv("MODEL_NAME", "arcee-ai/trinity-large-preview:free"),
-        api_key=os.getenv("OPENROUTER_API_KEY"),
-        base_url="https://openrouter.ai/api/v1",
-        model_info={
-            "vision": False, "function_calling": False,
-            "json_output": True, "structured_output": False, "family": "unknown",
-        },
-    )
-
-
-def parse_json(text):
-    try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        s, e = text.find("{"), text.rfind("}") + 1
-        if s != -1 and e > s:
-            return json.loads(text[s:e])
-        return {"raw": text}
-
-
-async def run_all_agents(chunks):
-    ctx = {"entities": [], "decisions": [], "constraints": []}
-    client = get_model_client()
-    msg = json.dumps({"document_chunks": chunks, "global_context": ctx}, indent=2)
-
-    team = RoundRobinGroupChat(
-        participants=[
-            create_summary_agent(client),
-            create_action_agent(client),
-            create_risk_agent(client),
-        ],
-        termination_condition=MaxMessageTermination(max_messages=4),
-    )
-
-    result = await team.run(task=msg)
-    out = {}
-    for m in result.messages:
-        if m.source == "Summary_Agent":
-            out["summary"] = parse_json(m.content)
-        elif m.source == "Action_Agent":
-            out["actions"] = parse_json(m.content)
-        elif m.source == "Risk_Agent":
-            out["risks"] = parse_json(m.content)
-    return out
-
-
 def esc(s):
     return html_lib.escape(str(s)) if s else ""
 
@@ -365,8 +316,19 @@ st.markdown("""
 uploaded = st.file_uploader("Upload a PDF document", type=["pdf"], label_visibility="collapsed")
 
 if uploaded:
+    pipelined = st.checkbox(
+        "Pipelined ingestion",
+        help=(
+            "Start analysing early pages while later pages are still being parsed (large documents). "
+            f"The document is analysed in windows of about {PIPELINE_WINDOW_CHARS:,} characters, each a "
+            "full 3-agent run, plus one extra call to merge the summaries: a document spanning N windows "
+            "costs 3N + 1 model calls instead of 3."
+        ),
+    )
     if st.button("Analyze Document"):
-        chunks = pdf_to_chunks(uploaded.read())
+        pdf_bytes = uploaded.read()
+        if not pipelined:
+            chunks = pdf_to_chunks(pdf_bytes)
 
         status = st.empty()
         with status.container():
@@ -378,8 +340,53 @@ if uploaded:
                     <div class="agent-tag running">Running</div>
                 </div>""", unsafe_allow_html=True)
 
+        partial = st.empty()
+
         t0 = time.time()
-        results = asyncio.run(run_all_agents(chunks))
+        first_result = []
+        if pipelined:
+            window_summaries = {}
+
+            def show_window(index, result):
+                if not first_result:
+                    first_result.append(round(time.time() - t0, 2))
+                summary = result.get("summary")
+                if isinstance(summary, dict) and isinstance(summary.get("summary"), str):
+                    window_summaries[index] = summary["summary"]
+                body = "".join(
+                    f'<p class="summary-p">{esc(window_summaries[i])}</p>' for i in sorted(window_summaries)
+                )
+                partial.markdown(f"""
+                <div class="rcard">
+                    <div class="rcard-head">
+                        <div class="rcard-icon s">📄</div>
+                        <div class="rcard-title">Early results</div>
+                        <div class="rcard-count">{len(window_summaries)} sections analysed</div>
+                    </div>
+                    <div class="rcard-body">{body}</div>
+                </div>""", unsafe_allow_html=True)
+
+            key = content_key(pdf_bytes, {
+                "mode": "pipelined",
+                "max_chars": PIPELINE_CHUNK_CHARS,
+                "window_chars": PIPELINE_WINDOW_CHARS,
+                "max_windows_in_flight": PIPELINE_WINDOWS_IN_FLIGHT,
+            })
+            (results, chunk_count), coalesced = asyncio.run(run_coalesced(
+                key, lambda: run_agents_pipelined(
+                    stream_pdf_chunks(pdf_bytes, PIPELINE_CHUNK_CHARS),
+                    window_chars=PIPELINE_WINDOW_CHARS,
+                    max_windows_in_flight=PIPELINE_WINDOWS_IN_FLIGHT,
+                    on_result=show_window,
+                )
+            ))
+            partial.empty()
+        else:
+            # Identical uploads analysed at the same time share one run
+            results, coalesced = asyncio.run(
+                run_coalesced(analysis_key(chunks), lambda: run_agents(chunks))
+            )
+            chunk_count = len(chunks)
         elapsed = round(time.time() - t0, 2)
 
         with status.container():
@@ -393,10 +400,14 @@ if uploaded:
 
         st.session_state["output"] = {
             "filename": uploaded.name,
-            "chunks_processed": len(chunks),
+            "chunks_processed": chunk_count,
             "processing_time_seconds": elapsed,
+            "coalesced_requests": coalesced,
             "results": results,
         }
+        if pipelined:
+            # Requests attached to another session's run see everything at once
+            st.session_state["output"]["first_result_seconds"] = first_result[0] if first_result else elapsed
 
 if "output" in st.session_state:
     data = st.session_state["output"]
@@ -408,6 +419,7 @@ if "output" in st.session_state:
         <div class="meta-item"><div class="meta-icon">📦</div>{data['chunks_processed']} chunks processed</div>
         <div class="meta-item"><div class="meta-icon">⏱️</div>{data['processing_time_seconds']}s total</div>
         <div class="meta-item"><div class="meta-icon">📄</div>{esc(data['filename'])}</div>
+        {f'<div class="meta-item"><div class="meta-icon">🔗</div>{data["coalesced_requests"]} requests coalesced</div>' if data.get("coalesced_requests") else ""}
     </div>
     """, unsafe_allow_html=True)
 
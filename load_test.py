@@ -0,0 +1,363 @@
+"""End-to-end load test for the document analysis pipeline.
+
+Drives N concurrent simulated users against a local stand-in for the chat
+completions endpoint, then reports latency percentiles, throughput, error
+rates and peak memory.
+
+app.py is a Streamlit script and cannot be imported, so each request calls
+the same library functions its Analyze button does: pdf_to_chunks ->
+orchestrator.run_agents (or run_agents_pipelined) -> JSON serialisation of
+the report, as for the download button. The HTML card rendering is not
+exercised.
+
+The stand-in endpoint runs in a separate process and the test PDFs are
+generated in one, so neither competes for this process's GIL or counts
+toward its peak RSS. The generated PDF bytes are held in memory here, as
+uploads would be.
+
+Model calls are not retried by default (--max-retries 0), so the injected
+--error-rate is what the pipeline sees; the report gives both the
+HTTP-level error rate counted by the stub and the per-request error rate.
+
+With --packed, each user's uploads are analysed as one batch through
+orchestrator.run_agents_packed, and the stub answers packed requests with
+one entry per document. Compare it against the same run without --packed
+on a small-document mix (e.g. --sizes 1,2 --requests-per-user 8) to
+measure the throughput gain.
+
+Example:
+    python load_test.py --users 50 --requests-per-user 2 --latency 1.5 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import fitz  # PyMuPDF
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Canned agent replies, picked by matching the agent's system prompt
+STUB_REPLIES = {
+    "Summary Agent": {"summary": "Stand-in summary of the uploaded document."},
+    "Action & Dependency": {"actions": [
+        {"task": "Review the document", "owner": None, "dependency": None, "deadline": None},
+    ]},
+    "Risk & Open-Issues": {"risks": ["Stand-in risk raised by the load test."]},
+}
+
+WORDS = (
+    "project team migration budget deadline compliance review storage backend "
+    "frontend schema owner legal vendor release scope pipeline approval"
+).split()
+
+
+# ── Stand-in model endpoint ──
+
+class StubModelHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /chat/completions endpoint."""
+
+    latency = 1.0
+    jitter = 0.0
+    error_rate = 0.0
+    stats = {"calls": 0, "errors": 0}
+    stats_lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.stats_lock:
+                self._send(200, dict(self.stats))
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        failed = random.random() < self.error_rate
+        with self.stats_lock:
+            self.stats["calls"] += 1
+            self.stats["errors"] += failed
+        if failed:
+            self._send(500, {"error": {"message": "stand-in model error", "type": "server_error"}})
+            return
+
+        system = next((m["content"] for m in body.get("messages", []) if m.get("role") == "system"), "")
+        reply = next((r for k, r in STUB_REPLIES.items() if k in system), {"raw": "unknown agent"})
+        # Packed requests get one entry per delimited document
+        doc_ids = list(dict.fromkeys(
+            doc_id
+            for m in body.get("messages", []) if m.get("role") == "user"
+            for doc_id in re.findall(r"BEGIN DOCUMENT (\S+) =====", str(m.get("content", "")))
+        ))
+        if doc_ids:
+            reply = {"documents": [{"document_id": doc_id, **reply} for doc_id in doc_ids]}
+        self._send(200, {
+            "id": "chatcmpl-loadtest",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": json.dumps(reply)},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    def _send(self, code, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_stub(latency: float, jitter: float, error_rate: float, ports) -> None:
+    """Stub server process entry point; reports its port through `ports`."""
+    handler = type("Handler", (StubModelHandler,), {
+        "latency": latency, "jitter": jitter, "error_rate": error_rate,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_stub_server(latency: float, jitter: float, error_rate: float) -> tuple[multiprocessing.Process, str]:
+    """Start the stand-in endpoint in a child process; returns it and its base URL."""
+    ports = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=_serve_stub, args=(latency, jitter, error_rate, ports), daemon=True,
+    )
+    proc.start()
+    return proc, f"http://127.0.0.1:{ports.get(timeout=30)}"
+
+
+def fetch_stub_stats(base_url: str) -> dict:
+    """Model-call counters collected by the stand-in endpoint."""
+    with urllib.request.urlopen(f"{base_url}/stats", timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+# ── Workload ──
+
+def generate_pdf(pages: int, seed: int) -> bytes:
+    """Build a PDF with `pages` pages of pseudo-random sentences."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        text = " ".join(
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "."
+            for _ in range(30)
+        )
+        page.insert_textbox(page.rect + (50, 50, -50, -50), text, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(max(1, math.ceil(pct / 100 * len(ordered))), len(ordered))
+    return ordered[rank - 1]
+
+
+def peak_memory_mb() -> float | None:
+    """Peak resident set size of this process in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if os.uname().sysname == "Darwin" else 1024), 1)
+
+
+def simulate_request(pdf_bytes: bytes, coalesce: bool, pipelined: bool = False) -> tuple[float, float]:
+    """Run one upload through the same steps as app.py's Analyze button.
+
+    Returns the total latency and the time until the first agent result.
+    """
+    from orchestrator import run_agents, run_agents_coalesced, run_agents_pipelined
+    from pdf_parser import pdf_to_chunks, stream_pdf_chunks
+
+    t0 = time.perf_counter()
+    first_result = []
+
+    def record_first(index, result):
+        if not first_result:
+            first_result.append(time.perf_counter() - t0)
+
+    coalesced = 0
+    if pipelined:
+        results, chunk_count = asyncio.run(
+            run_agents_pipelined(stream_pdf_chunks(pdf_bytes), on_result=record_first)
+        )
+    else:
+        chunks = pdf_to_chunks(pdf_bytes)
+        chunk_count = len(chunks)
+        if coalesce:
+            results, coalesced = asyncio.run(run_agents_coalesced(chunks))
+        else:
+            results = asyncio.run(run_agents(chunks))
+    if set(results) != {"summary", "actions", "risks"}:
+        raise RuntimeError(f"incomplete results: {sorted(results)}")
+    json.dumps({
+        "chunks_processed": chunk_count,
+        "coalesced_requests": coalesced,
+        "results": results,
+    }, indent=2)
+    elapsed = time.perf_counter() - t0
+    return elapsed, first_result[0] if first_result else elapsed
+
+
+def simulate_packed_batch(uploads: list[bytes]) -> float:
+    """Analyse a batch of uploads with run_agents_packed and return the batch latency."""
+    from orchestrator import run_agents_packed
+    from pdf_parser import pdf_to_chunks
+
+    t0 = time.perf_counter()
+    documents = [pdf_to_chunks(pdf_bytes) for pdf_bytes in uploads]
+    reports = asyncio.run(run_agents_packed(documents))
+    for results in reports:
+        if set(results) != {"summary", "actions", "risks"}:
+            raise RuntimeError(f"incomplete results: {sorted(results)}")
+    json.dumps(reports, indent=2)
+    return time.perf_counter() - t0
+
+
+def run_load_test(args) -> dict:
+    """Drive the pipeline with the configured number of concurrent users."""
+    sizes = [int(s) for s in args.sizes.split(",")]
+    print(f"Generating {args.distinct_docs} PDFs with page counts {sizes}...")
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pdfs = list(pool.map(
+            generate_pdf,
+            [sizes[i % len(sizes)] for i in range(args.distinct_docs)],
+            range(args.distinct_docs),
+        ))
+
+    rng = random.Random(args.seed)
+    workload = [
+        [rng.choice(pdfs) for _ in range(args.requests_per_user)]
+        for _ in range(args.users)
+    ]
+
+    latencies, first_results, errors = [], [], []
+    lock = threading.Lock()
+
+    def user(uploads):
+        if args.packed:
+            # Each user's uploads go through as one packed batch
+            try:
+                elapsed = simulate_packed_batch(uploads)
+                with lock:
+                    latencies.extend([elapsed] * len(uploads))
+                    first_results.extend([elapsed] * len(uploads))
+            except Exception as exc:
+                with lock:
+                    errors.extend([repr(exc)] * len(uploads))
+            return
+        for pdf_bytes in uploads:
+            try:
+                elapsed, first = simulate_request(pdf_bytes, args.coalesce, args.pipelined)
+                with lock:
+                    latencies.append(elapsed)
+                    first_results.append(first)
+            except Exception as exc:
+                with lock:
+                    errors.append(repr(exc))
+
+    print(f"Running {args.users} users x {args.requests_per_user} requests...")
+    t0 = time.perf_counter()
+    # One thread per user with its own event loop, like Streamlit sessions
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user, workload))
+    wall = time.perf_counter() - t0
+
+    total = len(latencies) + len(errors)
+    stub = fetch_stub_stats(os.environ["MODEL_BASE_URL"]) if not args.target else None
+    return {
+        "pipeline": "pdf_to_chunks -> orchestrator.{} -> json report (in-process)".format(
+            "run_agents_packed" if args.packed
+            else "run_agents_pipelined" if args.pipelined
+            else "run_agents_coalesced" if args.coalesce
+            else "run_agents"
+        ),
+        "users": args.users,
+        "requests": total,
+        "wall_time_seconds": round(wall, 2),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "request_error_rate": round(len(errors) / total, 4) if total else 0.0,
+        "model_calls": stub["calls"] if stub else None,
+        "model_call_error_rate": round(stub["errors"] / stub["calls"], 4) if stub and stub["calls"] else None,
+        "model_max_retries": args.max_retries,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "first_result_p50_seconds": round(percentile(first_results, 50), 3),
+        "peak_memory_mb": peak_memory_mb(),
+        "sample_errors": errors[:5],
+    }
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Load-test the document analysis pipeline.")
+    p.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    p.add_argument("--requests-per-user", type=int, default=1)
+    p.add_argument("--sizes", default="1,5,20", help="comma-separated PDF page counts to mix")
+    p.add_argument("--distinct-docs", type=int, default=6, help="number of distinct PDFs in the mix")
+    p.add_argument("--latency", type=float, default=1.0, help="mean stand-in model latency (s)")
+    p.add_argument("--jitter", type=float, default=0.2, help="stddev of model latency (s)")
+    p.add_argument("--error-rate", type=float, default=0.0, help="fraction of model calls that fail")
+    p.add_argument("--max-retries", type=int, default=0,
+                   help="OpenAI SDK retries per model call (the SDK default is 2)")
+    p.add_argument("--coalesce", action="store_true", help="use run_agents_coalesced")
+    p.add_argument("--pipelined", action="store_true", help="use pipelined ingestion (run_agents_pipelined)")
+    p.add_argument("--packed", action="store_true",
+                   help="send each user's uploads as one batch through run_agents_packed")
+    p.add_argument("--target", help="base URL of a real endpoint instead of the local stand-in")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    random.seed(args.seed)
+
+    os.environ["MODEL_MAX_RETRIES"] = str(args.max_retries)
+    if args.target:
+        os.environ["MODEL_BASE_URL"] = args.target
+    else:
+        stub_proc, os.environ["MODEL_BASE_URL"] = start_stub_server(args.latency, args.jitter, args.error_rate)
+        os.environ["OPENROUTER_API_KEY"] = "load-test"
+
+    report = run_load_test(args)
+    if not args.target:
+        stub_proc.terminate()
+    print("\n" + "=" * 60)
+    print("LOAD TEST REPORT")
+    print("=" * 60)
+    print(json.dumps(report, indent=2))
@@ -1,6 +1,10 @@
 import asyncio
+import concurrent.futures
+import hashlib
 import json
 import os
+import threading
+from typing import AsyncIterable, Callable
 
 from dotenv import load_dotenv
 from autogen_ext.models.openai import OpenAIChatCompletionClient
@@ -13,13 +17,29 @@ from agents.risk_agent import create_agent as create_risk_agent
 
 load_dotenv()
 
+# Result field produced by each agent
+AGENT_FIELDS = {
+    "Summary_Agent": "summary",
+    "Action_Agent": "actions",
+    "Risk_Agent": "risks",
+}
+
+# In-flight analyses keyed by analysis_key(); shared across threads so that
+# Streamlit sessions (each with its own event loop) can attach to each other.
+_in_flight: dict[str, "_Flight"] = {}
+_in_flight_lock = threading.Lock()
+
 
 def get_model_client() -> OpenAIChatCompletionClient:
     """Build the model client via OpenRouter."""
+    extra = {}
+    # MODEL_MAX_RETRIES overrides the OpenAI SDK's default of 2 retries
+    if os.getenv("MODEL_MAX_RETRIES"):
+        extra["max_retries"] = int(os.getenv("MODEL_MAX_RETRIES"))
     return OpenAIChatCompletionClient(
         model=os.getenv("MODEL_NAME", "arcee-ai/trinity-large-preview:free"),
         api_key=os.getenv("OPENROUTER_API_KEY"),
-        base_url="https://openrouter.ai/api/v1",
+        base_url=os.getenv("MODEL_BASE_URL", "https://openrouter.ai/api/v1"),
         model_info={
             "vision": False,
             "function_calling": False,
@@ -27,6 +47,7 @@ def get_model_client() -> OpenAIChatCompletionClient:
             "structured_output": False,
             "family": "unknown",
         },
+        **extra,
     )
 
 
@@ -50,24 +71,118 @@ def parse_json(text: str) -> dict:
         return {"raw": text}
 
 
-async def run_agents(document_chunks: list[str], global_context: dict | None = None) -> dict:
-    """Create a RoundRobinGroupChat with all 3 agents and run them."""
+def analysis_key(document_chunks: list[str], global_context: dict | None = None) -> str:
+    """Hash the document content and analysis configuration into a coalescing key."""
     if global_context is None:
         global_context = {"entities": [], "decisions": [], "constraints": []}
+    payload = json.dumps({
+        "document_chunks": document_chunks,
+        "global_context": global_context,
+        "model": os.getenv("MODEL_NAME", "arcee-ai/trinity-large-preview:free"),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def content_key(content: bytes, config: dict) -> str:
+    """Hash raw document bytes and an explicit analysis configuration into a coalescing key."""
+    payload = json.dumps({
+        "content_sha256": hashlib.sha256(content).hexdigest(),
+        "config": config,
+        "model": os.getenv("MODEL_NAME", "arcee-ai/trinity-large-preview:free"),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CoalescedRunError(RuntimeError):
+    """Raised in a request that attached to an in-flight analysis which failed."""
+
+
+class _LeaderCancelled(Exception):
+    """Set on a flight whose leader was cancelled, so an attached request takes over."""
+
+
+class _Flight:
+    """A single in-flight analysis and the number of requests attached to it."""
+
+    def __init__(self):
+        self.future = concurrent.futures.Future()
+        self.coalesced = 0
+
+
+async def run_coalesced(key: str, run) -> tuple[dict, int]:
+    """Run `run()` once per key; concurrent callers with the same key share its result.
+
+    Returns the result and the number of requests that attached to the
+    in-flight analysis instead of starting their own. If the running request
+    is cancelled, one of the attached requests starts the analysis again.
+    """
+    while True:
+        with _in_flight_lock:
+            flight = _in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _in_flight[key] = _Flight()
+            else:
+                flight.coalesced += 1
+
+        if not leader:
+            try:
+                # Shield so a cancelled follower does not cancel the shared future.
+                return await asyncio.shield(asyncio.wrap_future(flight.future))
+            except _LeaderCancelled:
+                continue
+            except Exception as exc:
+                # A fresh exception per follower; the shared one is only chained
+                raise CoalescedRunError(f"coalesced analysis failed: {exc!r}") from exc
+            except BaseException:
+                # A follower that leaves early is not counted as coalesced
+                with _in_flight_lock:
+                    flight.coalesced -= 1
+                raise
+
+        try:
+            result = await run()
+        except Exception as exc:
+            with _in_flight_lock:
+                del _in_flight[key]
+            flight.future.set_exception(exc)
+            raise
+        except BaseException:
+            with _in_flight_lock:
+                del _in_flight[key]
+            flight.future.set_exception(_LeaderCancelled())
+            raise
+        with _in_flight_lock:
+            del _in_flight[key]
+            coalesced = flight.coalesced
+        flight.future.set_result((result, coalesced))
+        return result, coalesced
+
 
+def build_team(packed: bool = False) -> RoundRobinGroupChat:
+    """Create a RoundRobinGroupChat in which each of the 3 agents takes one turn.
+
+    With packed=True the agents use their multi-document output format.
+    """
     model_client = get_model_client()
 
     # Create the 3 specialist agents
-    summary_agent = create_summary_agent(model_client)
-    action_agent = create_action_agent(model_client)
-    risk_agent = create_risk_agent(model_client)
+    summary_agent = create_summary_agent(model_client, packed=packed)
+    action_agent = create_action_agent(model_client, packed=packed)
+    risk_agent = create_risk_agent(model_client, packed=packed)
 
-    # Build RoundRobinGroupChat — each agent takes one turn
-    team = RoundRobinGroupChat(
+    return RoundRobinGroupChat(
         participants=[summary_agent, action_agent, risk_agent],
         termination_condition=MaxMessageTermination(max_messages=4),
     )
 
+
+async def run_agents(document_chunks: list[str], global_context: dict | None = None) -> dict:
+    """Create a RoundRobinGroupChat with all 3 agents and run them."""
+    if global_context is None:
+        global_context = {"entities": [], "decisions": [], "constraints": []}
+
+    team = build_team()
     message = build_user_message(document_chunks, global_context)
 
     print("Running RoundRobinGroupChat with 3 agents...")
@@ -76,16 +191,287 @@ async def run_agents(document_chunks: list[str], global_context: dict | None = N
     # Parse each agent's response from the chat messages
     results = {}
     for msg in task_result.messages:
-        if msg.source == "Summary_Agent":
-            results["summary"] = parse_json(msg.content)
-        elif msg.source == "Action_Agent":
-            results["actions"] = parse_json(msg.content)
-        elif msg.source == "Risk_Agent":
-            results["risks"] = parse_json(msg.content)
+        if msg.source in AGENT_FIELDS:
+            results[AGENT_FIELDS[msg.source]] = parse_json(msg.content)
 
     return results
 
 
+async def run_agents_coalesced(document_chunks: list[str], global_context: dict | None = None) -> tuple[dict, int]:
+    """Like run_agents, but identical concurrent analyses share a single run."""
+    key = analysis_key(document_chunks, global_context)
+    return await run_coalesced(key, lambda: run_agents(document_chunks, global_context))
+
+
+def _listed(value, key: str) -> list | None:
+    """The list under `key` in an agent reply, or None if the reply is not in that shape."""
+    if isinstance(value, dict) and isinstance(value.get(key), list):
+        return value[key]
+    return None
+
+
+def merge_results(window_results: list[dict], summary: dict | None = None) -> dict:
+    """Combine per-window agent results into a single report.
+
+    Actions are deduplicated by task and risks by text. Window replies that
+    are not in the expected shape (e.g. parse_json's {"raw": ...} fallback)
+    are kept under "raw" instead of being dropped. `summary` is the
+    consolidated summary; without it the window summaries are kept unmerged
+    under "window_summaries".
+    """
+    actions, risks, raw = {}, [], {"summary": [], "actions": [], "risks": []}
+    summaries = []
+    for r in window_results:
+        window_summary = r.get("summary")
+        if isinstance(window_summary, dict) and isinstance(window_summary.get("summary"), str):
+            summaries.append(window_summary["summary"])
+        elif window_summary is not None:
+            raw["summary"].append(window_summary)
+
+        window_actions = _listed(r.get("actions"), "actions")
+        if window_actions is None:
+            raw["actions"].append(r.get("actions"))
+        for action in window_actions or []:
+            task = action.get("task") if isinstance(action, dict) else None
+            key = str(task).strip().casefold() if task else json.dumps(action, sort_keys=True)
+            if key not in actions:
+                actions[key] = action
+            elif isinstance(action, dict) and isinstance(actions[key], dict):
+                # Fill in owner/dependency/deadline that only a later window found
+                for field, value in action.items():
+                    if actions[key].get(field) is None:
+                        actions[key][field] = value
+
+        window_risks = _listed(r.get("risks"), "risks")
+        if window_risks is None:
+            raw["risks"].append(r.get("risks"))
+        for risk in window_risks or []:
+            if risk not in risks:
+                risks.append(risk)
+
+    merged = {
+        "summary": summary if summary is not None else {"summary": "", "window_summaries": summaries},
+        "actions": {"actions": list(actions.values())},
+        "risks": {"risks": risks},
+    }
+    for field, values in raw.items():
+        values = [v for v in values if v is not None]
+        if values and isinstance(merged[field], dict):
+            merged[field].setdefault("raw", []).extend(values)
+    return merged
+
+
+async def consolidate_summaries(summaries: list[str], global_context: dict | None = None) -> dict:
+    """Run the Summary Agent once over per-window summaries to produce one document summary."""
+    if global_context is None:
+        global_context = {"entities": [], "decisions": [], "constraints": []}
+    agent = create_summary_agent(get_model_client())
+    task_result = await agent.run(task=build_user_message(summaries, global_context))
+    replies = [m for m in task_result.messages if m.source == "Summary_Agent"]
+    return parse_json(replies[-1].content) if replies else {"raw": ""}
+
+
+async def run_agents_pipelined(
+    chunks: AsyncIterable[str],
+    global_context: dict | None = None,
+    window_chars: int = 16000,
+    max_windows_in_flight: int = 2,
+    on_result: Callable[[int, dict], None] | None = None,
+) -> tuple[dict, int]:
+    """Run the agents on windows of chunks while later chunks are still being produced.
+
+    Chunks are grouped into windows of up to `window_chars` characters and
+    each window is analysed as soon as it is full. At most
+    `max_windows_in_flight` windows run at once; further chunks are not
+    pulled until one finishes, so backpressure reaches the producer.
+    `on_result(index, result)` is called as each window completes.
+
+    Each window is a full 3-agent team run, and documents spanning more than
+    one window get one extra Summary Agent call to consolidate the window
+    summaries, so an N-window document costs 3N + 1 model calls. The first
+    failing window stops the run and closes `chunks`.
+    Returns the merged results and the number of chunks processed.
+    """
+    slots = asyncio.Semaphore(max_windows_in_flight)
+    tasks = []
+    chunk_count = 0
+
+    async def analyse(index, window):
+        try:
+            result = await run_agents(window, global_context)
+        finally:
+            slots.release()
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    def raise_if_failed():
+        for task in tasks:
+            if task.done() and not task.cancelled() and task.exception() is not None:
+                raise task.exception()
+
+    async def launch(window):
+        await slots.acquire()
+        # A failed window frees its slot; stop here rather than send more work
+        try:
+            raise_if_failed()
+        except BaseException:
+            slots.release()
+            raise
+        tasks.append(asyncio.create_task(analyse(len(tasks), window)))
+
+    try:
+        window, size = [], 0
+        async for chunk in chunks:
+            raise_if_failed()
+            chunk_count += 1
+            if window and size + len(chunk) > window_chars:
+                await launch(window)
+                window, size = [], 0
+            window.append(chunk)
+            size += len(chunk)
+        if window or not tasks:
+            await launch(window)
+        window_results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        # Stops the extraction thread when the run ends early
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+
+    if len(window_results) == 1:
+        return window_results[0], chunk_count
+
+    summaries = [
+        r["summary"]["summary"] for r in window_results
+        if isinstance(r.get("summary"), dict) and isinstance(r["summary"].get("summary"), str)
+    ]
+    summary = await consolidate_summaries(summaries, global_context) if summaries else None
+    return merge_results(window_results, summary), chunk_count
+
+
+def estimate_tokens(document_chunks: list[str]) -> int:
+    """Rough token count for a document (about 4 characters per token)."""
+    return sum(len(chunk) for chunk in document_chunks) // 4 + 1
+
+
+def pack_documents(documents: list[list[str]], token_budget: int = 6000,
+                   max_documents: int = 8) -> list[list[int]]:
+    """Group document indices, in order, into packs that fit the token budget.
+
+    A document larger than the budget gets a pack of its own.
+    """
+    packs, current, used = [], [], 0
+    for index, chunks in enumerate(documents):
+        tokens = estimate_tokens(chunks)
+        if current and (used + tokens > token_budget or len(current) >= max_documents):
+            packs.append(current)
+            current, used = [], 0
+        current.append(index)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def build_packed_message(documents: dict[str, list[str]], global_context: dict) -> str:
+    """Format several documents, delimited and labelled by ID, into one agent input."""
+    parts = [f"{len(documents)} documents follow: {', '.join(documents)}."]
+    for doc_id, chunks in documents.items():
+        parts.append(f"===== BEGIN DOCUMENT {doc_id} =====")
+        parts.append(json.dumps({"document_id": doc_id, "document_chunks": chunks}, indent=2))
+        parts.append(f"===== END DOCUMENT {doc_id} =====")
+    parts.append(json.dumps({"global_context": global_context}, indent=2))
+    return "\n\n".join(parts)
+
+
+def split_packed_response(text: str, doc_ids: list[str], field: str) -> dict[str, dict]:
+    """Split one agent's packed response into per-document results.
+
+    Documents missing from the response are left out; an unusable response
+    yields an empty dict.
+    """
+    try:
+        parsed = parse_json(text)
+    except ValueError:
+        return {}
+    entries = parsed.get("documents") if isinstance(parsed, dict) else None
+    if not isinstance(entries, list):
+        return {}
+
+    split = {}
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get("document_id") in doc_ids and field in entry:
+            split[entry["document_id"]] = {field: entry[field]}
+    return split
+
+
+async def _run_pack(pack: dict[str, list[str]], global_context: dict) -> list[dict]:
+    """Analyse a pack of documents with one team run.
+
+    If the packed run fails, every document in the pack is re-run
+    individually; otherwise only the documents it did not fully cover are.
+    """
+    doc_ids = list(pack)
+    if len(doc_ids) == 1:
+        return [await run_agents(pack[doc_ids[0]], global_context)]
+
+    team = build_team(packed=True)
+    print(f"Running RoundRobinGroupChat with 3 agents on {len(doc_ids)} packed documents...")
+    try:
+        task_result = await team.run(task=build_packed_message(pack, global_context))
+    except Exception as exc:
+        # e.g. a 5xx or a packed prompt over the context limit
+        print(f"Packed run failed ({exc!r}); re-running {doc_ids} individually")
+        return list(await asyncio.gather(*(run_agents(pack[d], global_context) for d in doc_ids)))
+
+    results = {doc_id: {} for doc_id in doc_ids}
+    for msg in task_result.messages:
+        if msg.source in AGENT_FIELDS:
+            field = AGENT_FIELDS[msg.source]
+            for doc_id, part in split_packed_response(msg.content, doc_ids, field).items():
+                results[doc_id][field] = part
+
+    incomplete = [d for d in doc_ids if set(results[d]) != set(AGENT_FIELDS.values())]
+    if incomplete:
+        print(f"Packed run did not split for {incomplete}; re-running them individually")
+        reruns = await asyncio.gather(*(run_agents(pack[d], global_context) for d in incomplete))
+        results.update(zip(incomplete, reruns))
+    return [results[doc_id] for doc_id in doc_ids]
+
+
+async def run_agents_packed(documents: list[list[str]], global_context: dict | None = None,
+                            token_budget: int = 6000, max_documents: int = 8) -> list[dict]:
+    """Run the agents over many small documents, sharing one team run per pack.
+
+    Documents are grouped up to `token_budget` estimated tokens and
+    `max_documents` per pack. Returns one {"summary", "actions", "risks"}
+    result per input document, in order. Documents whose packed responses
+    cannot be split back out are re-run one at a time.
+    """
+    if global_context is None:
+        global_context = {"entities": [], "decisions": [], "constraints": []}
+
+    packs = pack_documents(documents, token_budget, max_documents)
+    tasks = [
+        asyncio.create_task(_run_pack({f"doc-{i + 1}": documents[i] for i in pack}, global_context))
+        for pack in packs
+    ]
+    try:
+        pack_results = await asyncio.gather(*tasks)
+    except BaseException:
+        # Don't leave the other packs running after one has failed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return [result for results in pack_results for result in results]
+
+
 # ---- Example usage ----
 if __name__ == "__main__":
     sample_chunks = [
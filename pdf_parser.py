@@ -1,37 +1,119 @@
+import asyncio
+import threading
+from typing import AsyncIterator, Iterable, Iterator
+
 import fitz  # PyMuPDF
 
+_DONE = object()
+
+
+def iter_pages(file_bytes: bytes) -> Iterator[str]:
+    """Yield the text of each PDF page as it is extracted."""
+    doc = fitz.open(stream=file_bytes, filetype="pdf")
+    try:
+        for page in doc:
+            yield page.get_text()
+    finally:
+        doc.close()
+
 
 def extract_text_from_pdf(file_bytes: bytes) -> str:
     """Extract all text from a PDF file."""
-    doc = fitz.open(stream=file_bytes, filetype="pdf")
-    pages = []
-    for page in doc:
-        pages.append(page.get_text())
-    doc.close()
-    return "\n".join(pages)
+    return "\n".join(iter_pages(file_bytes))
 
 
-def chunk_text(text: str, max_chars: int = 2000) -> list[str]:
-    """Split text into chunks at sentence boundaries."""
-    sentences = text.replace("\n", " ").split(". ")
-    chunks = []
+def iter_chunks(pieces: Iterable[str], max_chars: int = 2000) -> Iterator[str]:
+    """Chunk newline-joined text pieces at sentence boundaries as they arrive.
+
+    Yields the same chunks as chunk_text("\\n".join(pieces), max_chars).
+    """
+    pending = None
     current = ""
+    seen = []  # kept only until the first chunk, for the empty-text fallback
+    emitted = False
 
-    for sentence in sentences:
+    def take(sentence):
+        nonlocal current
         candidate = f"{current}. {sentence}" if current else sentence
         if len(candidate) > max_chars and current:
-            chunks.append(current.strip())
+            done = current.strip()
             current = sentence
-        else:
-            current = candidate
+            return done
+        current = candidate
+        return None
+
+    for piece in pieces:
+        if not emitted:
+            seen.append(piece)
+        flat = piece.replace("\n", " ")
+        pending = flat if pending is None else f"{pending} {flat}"
+        # Everything before the last ". " is complete sentences
+        *sentences, pending = pending.split(". ")
+        for sentence in sentences:
+            done = take(sentence)
+            if done is not None:
+                emitted = True
+                seen = None
+                yield done
 
+    if pending is not None:
+        done = take(pending)
+        if done is not None:
+            emitted = True
+            yield done
     if current.strip():
-        chunks.append(current.strip())
+        yield current.strip()
+    elif not emitted:
+        yield "\n".join(seen)
 
-    return chunks if chunks else [text]
+
+def chunk_text(text: str, max_chars: int = 2000) -> list[str]:
+    """Split text into chunks at sentence boundaries."""
+    return list(iter_chunks([text], max_chars))
 
 
 def pdf_to_chunks(file_bytes: bytes, max_chars: int = 2000) -> list[str]:
     """Extract text from PDF and split into chunks."""
-    text = extract_text_from_pdf(file_bytes)
-    return chunk_text(text, max_chars)
+    return list(iter_chunks(iter_pages(file_bytes), max_chars))
+
+
+async def stream_pdf_chunks(file_bytes: bytes, max_chars: int = 2000,
+                            queue_size: int = 4) -> AsyncIterator[str]:
+    """Extract and chunk a PDF on a worker thread, yielding chunks as they are ready.
+
+    The bounded queue applies backpressure: extraction pauses while
+    `queue_size` chunks are waiting to be consumed.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            for chunk in iter_chunks(iter_pages(file_bytes), max_chars):
+                if stop.is_set():
+                    return
+                put(chunk)
+            put(_DONE)
+        except BaseException as exc:
+            if not stop.is_set():
+                put(exc)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # Unblock a producer waiting on a full queue if the consumer stops early
+        stop.set()
+        while not queue.empty():
+            queue.get_nowait()